@@ -1,30 +1,32 @@
+import os
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from typing import List, Dict, Any
 from app.models.document import DocumentResponse, DocumentSummary
 from app.services.rag_service import rag_service
-from app.core.config import settings
+from app.core.config import SETTINGS
 
 router = APIRouter()
 
 async def validate_file(file: UploadFile = File(...)):
     """Validate uploaded file."""
-    # Check file size
-    if file.size > settings.max_file_size:
+    # Early size check; the streaming save enforces the limit authoritatively
+    if file.size and file.size > SETTINGS.max_file_size:
         raise HTTPException(
             status_code=413,
-            detail=f"File too large. Maximum size is {settings.max_file_size} bytes"
+            detail=f"File too large. Maximum size is {SETTINGS.max_file_size} bytes"
         )
     
     # Check file extension
     if not file.filename:
         raise HTTPException(status_code=400, detail="Filename is required")
     
-    file_extension = file.filename.split('.')[-1].lower()
-    if file_extension not in settings.allowed_extensions:
+    # splitext handles extension-less names; frozenset lookup is O(1)
+    file_extension = os.path.splitext(file.filename)[1][1:].lower()
+    if file_extension not in SETTINGS.allowed_extensions:
         raise HTTPException(
             status_code=400,
-            detail=f"File type not supported. Allowed types: {', '.join(settings.allowed_extensions)}"
+            detail=f"File type not supported. Allowed types: {', '.join(sorted(SETTINGS.allowed_extensions))}"
         )
     
     return file
@@ -33,12 +35,9 @@ async def validate_file(file: UploadFile = File(...)):
 async def upload_document(file: UploadFile = Depends(validate_file)):
     """Upload and process a document."""
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Process document
+        # Process document (file is streamed to disk, never fully buffered)
         document = await rag_service.process_document(
-            file_content=file_content,
+            file=file,
             filename=file.filename,
             content_type=file.content_type
         )
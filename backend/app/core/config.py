@@ -1,4 +1,5 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
@@ -26,10 +27,39 @@ class Settings(BaseSettings):
     
     # Embedding Settings
     embedding_model: str = "all-MiniLM-L6-v2"
+    embedding_backend: str = "onnx-int8"  # "onnx-int8" (fastembed) or "torch"
+    embedding_precision: str = "auto"  # "auto", "bf16" or "int8"
+    embedding_batch_size: int = 64
+
+    # Chat Settings
+    chat_history_max_per_doc: int = 100
+    chat_history_max_docs: int = 256
     chunk_size: int = 1000
     chunk_overlap: int = 200
     
     class Config:
         env_file = ".env"
 
-settings = Settings() 
\ No newline at end of file
+@dataclass(frozen=True, slots=True)
+class FrozenConfig:
+    """Immutable snapshot of the settings read on hot request paths.
+
+    Attribute reads on a frozen slotted dataclass are plain C-level
+    lookups, unlike pydantic's descriptor path, and the extension set
+    gives O(1) membership checks.
+    """
+    upload_dir: str
+    max_file_size: int
+    allowed_extensions: frozenset
+    chunk_size: int
+    chunk_overlap: int
+
+settings = Settings()
+
+SETTINGS = FrozenConfig(
+    upload_dir=settings.upload_dir,
+    max_file_size=settings.max_file_size,
+    allowed_extensions=frozenset(ext.strip().lower() for ext in settings.allowed_extensions),
+    chunk_size=settings.chunk_size,
+    chunk_overlap=settings.chunk_overlap,
+) 
\ No newline at end of file
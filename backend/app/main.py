@@ -1,16 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from app.core.config import settings
 from app.api import documents, chat
 
-# Create FastAPI app
+# Create FastAPI app (orjson serializes responses, numpy types included,
+# far faster than the stdlib json encoder)
 app = FastAPI(
     title=settings.app_name,
     version=settings.version,
     description=settings.description,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -1,43 +1,119 @@
+import asyncio
+import hashlib
 import os
+import re
 import uuid
-from typing import List, Dict, Any, Tuple
-import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+import pymupdf
 from docx import Document
 import aiofiles
 from datetime import datetime
-from app.core.config import settings
+from app.core.config import settings, SETTINGS
+
+# Serial extraction is cheaper than process spawns for small PDFs
+MIN_PAGES_FOR_PARALLEL = 4
+
+# Uploads are streamed to disk in 1MB chunks
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Sentence endings used as preferred chunk break points
+_SENTENCE_END = re.compile(r'[.!?](?=\s|$)|\n\n')
+
+# Shared pool for CPU-bound extraction work, created lazily so worker
+# processes importing this module do not spawn pools of their own
+_EXTRACT_POOL: Optional[ProcessPoolExecutor] = None
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _EXTRACT_POOL
+    if _EXTRACT_POOL is None:
+        _EXTRACT_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _EXTRACT_POOL
+
+def _extract_docx(file_path: str) -> Tuple[str, Dict[str, Any]]:
+    """Run DOCX extraction in a worker process (python-docx is pure Python)."""
+    return document_processor.extract_text_from_docx(file_path)
+
+def _extract_page_text(args: Tuple[str, int]) -> Tuple[int, str]:
+    """Extract text from a single PDF page (process pool worker)."""
+    file_path, page_num = args
+    doc = pymupdf.open(file_path)
+    try:
+        return page_num, doc[page_num].get_text("text")
+    finally:
+        doc.close()
+
+@lru_cache(maxsize=16)
+def _open_pdf(file_path: str, stat_key: Tuple[float, int]) -> pymupdf.Document:
+    """Open a PDF, keeping recently parsed documents alive across calls."""
+    return pymupdf.open(file_path)
+
+def open_pdf_cached(file_path: str) -> pymupdf.Document:
+    """Get a parsed PDF handle, reusing a warm one when the file is unchanged."""
+    stat = os.stat(file_path)
+    return _open_pdf(file_path, (stat.st_mtime, stat.st_size))
 
 class DocumentProcessor:
     def __init__(self):
         self.upload_dir = settings.upload_dir
         os.makedirs(self.upload_dir, exist_ok=True)
     
-    async def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
-        """Save uploaded file and return the file path."""
+    async def save_uploaded_file(self, file, filename: str) -> Tuple[str, int, str]:
+        """Stream an uploaded file to disk; return the file path, size and digest."""
         file_id = str(uuid.uuid4())
         file_extension = filename.split('.')[-1].lower()
         safe_filename = f"{file_id}.{file_extension}"
         file_path = os.path.join(self.upload_dir, safe_filename)
-        
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
-        
-        return file_path
+
+        file_size = 0
+        hasher = hashlib.blake2b(digest_size=16)
+        try:
+            async with aiofiles.open(file_path, 'wb') as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > SETTINGS.max_file_size:
+                        raise Exception(
+                            f"File too large. Maximum size is {SETTINGS.max_file_size} bytes"
+                        )
+                    hasher.update(chunk)
+                    await f.write(chunk)
+        except Exception:
+            self.delete_file(file_path)
+            raise
+
+        return file_path, file_size, hasher.hexdigest()
     
     def extract_text_from_pdf(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text from PDF file."""
         try:
-            text = ""
             metadata = {"page_count": 0, "word_count": 0}
-            
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                metadata["page_count"] = len(pdf_reader.pages)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-            
+
+            doc = open_pdf_cached(file_path)
+            page_count = doc.page_count
+            metadata["page_count"] = page_count
+
+            parts = []
+            if page_count < MIN_PAGES_FOR_PARALLEL:
+                for page_num, page in enumerate(doc):
+                    page_text = page.get_text("text")
+                    # Skip image-only/blank pages so they don't flow into
+                    # chunking and embedding downstream
+                    if not page_text.strip():
+                        continue
+                    parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+            else:
+                # Fan page extraction out across cores; pages are independent
+                results = _get_extract_pool().map(
+                    _extract_page_text,
+                    [(file_path, i) for i in range(page_count)]
+                )
+                for page_num, page_text in results:
+                    if not page_text.strip():
+                        continue
+                    parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+
+            text = ''.join(parts)
             metadata["word_count"] = len(text.split())
             return text, metadata
             
@@ -49,22 +125,22 @@ class DocumentProcessor:
         """Extract text from DOCX file."""
         try:
             doc = Document(file_path)
-            text = ""
+            parts = []
             paragraph_count = 0
-            
+
             for paragraph in doc.paragraphs:
                 if paragraph.text.strip():
-                    text += paragraph.text + "\n"
+                    parts.append(paragraph.text + "\n")
                     paragraph_count += 1
-            
+
             # Extract text from tables
             for table in doc.tables:
                 for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text += cell.text + " "
-                    text += "\n"
-            
+                    row_cells = [cell.text for cell in row.cells if cell.text.strip()]
+                    parts.append(' '.join(row_cells) + "\n")
+
+            text = ''.join(parts)
+
             metadata = {
                 "paragraph_count": paragraph_count,
                 "table_count": len(doc.tables),
@@ -77,123 +153,112 @@ class DocumentProcessor:
             print(f"Error extracting DOCX text: {e}")
             return "", {"paragraph_count": 0, "table_count": 0, "word_count": 0}
     
-    def extract_text_from_txt(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
+    async def extract_text_from_txt(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text from TXT file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-            
+            try:
+                async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
+                    text = await file.read()
+            except UnicodeDecodeError:
+                async with aiofiles.open(file_path, 'r', encoding='latin-1') as file:
+                    text = await file.read()
+
+            # Count newlines in place instead of splitting into a throwaway list
             metadata = {
-                "line_count": len(text.split('\n')),
+                "line_count": text.count('\n') + 1,
                 "word_count": len(text.split()),
                 "char_count": len(text)
             }
-            
+
             return text, metadata
-            
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, 'r', encoding='latin-1') as file:
-                    text = file.read()
-                metadata = {
-                    "line_count": len(text.split('\n')),
-                    "word_count": len(text.split()),
-                    "char_count": len(text)
-                }
-                return text, metadata
-            except Exception as e:
-                print(f"Error extracting TXT text: {e}")
-                return "", {"line_count": 0, "word_count": 0, "char_count": 0}
+
         except Exception as e:
             print(f"Error extracting TXT text: {e}")
             return "", {"line_count": 0, "word_count": 0, "char_count": 0}
     
-    def extract_text_from_file(self, file_path: str, filename: str) -> Tuple[str, Dict[str, Any]]:
+    async def extract_text_from_file(self, file_path: str, filename: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text from any supported file type."""
         file_extension = filename.split('.')[-1].lower()
-        
+
+        loop = asyncio.get_running_loop()
         if file_extension == 'pdf':
-            return self.extract_text_from_pdf(file_path)
+            # Runs on a thread; the heavy per-page work goes to the process pool
+            return await loop.run_in_executor(None, self.extract_text_from_pdf, file_path)
         elif file_extension == 'docx':
-            return self.extract_text_from_docx(file_path)
+            return await loop.run_in_executor(_get_extract_pool(), _extract_docx, file_path)
         elif file_extension in ['txt', 'md']:
-            return self.extract_text_from_txt(file_path)
+            return await self.extract_text_from_txt(file_path)
         else:
             return "", {"error": f"Unsupported file type: {file_extension}"}
     
-    def chunk_text(self, text: str, filename: str = "", chunk_size: int = None, chunk_overlap: int = None) -> List[Dict[str, Any]]:
-        """Split text into chunks for vector storage."""
-        if chunk_size is None:
-            chunk_size = settings.chunk_size
-        if chunk_overlap is None:
-            chunk_overlap = settings.chunk_overlap
-        
-        chunks = []
+    def _iter_chunk_bounds(self, text: str, chunk_size: int, chunk_overlap: int):
+        """Yield (start, end, trim_start, trim_end) chunk bounds without copying text."""
         text_length = len(text)
-        
-        if text_length <= chunk_size:
-            chunks.append({
-                "content": text,
-                "chunk_index": 0,
-                "start_char": 0,
-                "end_char": text_length,
-                "metadata": {
-                    "filename": filename,
-                    "total_chunks": 1
-                }
-            })
-            return chunks
-        
         start_pos = 0
-        chunk_index = 0
-        
+
         while start_pos < text_length:
             end_pos = min(start_pos + chunk_size, text_length)
-            
+
             # Try to break at sentence boundaries
             if end_pos < text_length:
                 # Look for sentence endings within the last 100 characters
                 search_start = max(end_pos - 100, start_pos)
-                sentence_endings = ['.', '!', '?', '\n\n']
-                
-                best_break = -1
-                for ending in sentence_endings:
-                    pos = text.rfind(ending, search_start, end_pos)
-                    if pos > best_break:
-                        best_break = pos
-                
-                if best_break > start_pos:
-                    end_pos = best_break + 1
-            
-            chunk_content = text[start_pos:end_pos].strip()
-            
-            if chunk_content:
-                chunks.append({
-                    "content": chunk_content,
-                    "chunk_index": chunk_index,
-                    "start_char": start_pos,
-                    "end_char": end_pos,
-                    "metadata": {
-                        "filename": filename,
-                        "chunk_size": len(chunk_content)
-                    }
-                })
-                chunk_index += 1
-            
+
+                last_end = -1
+                for match in _SENTENCE_END.finditer(text, search_start, end_pos):
+                    last_end = match.end()
+
+                if last_end > start_pos:
+                    end_pos = last_end
+
+            # Trim whitespace by moving the bounds so only one slice is made
+            trim_start, trim_end = start_pos, end_pos
+            while trim_start < trim_end and text[trim_start].isspace():
+                trim_start += 1
+            while trim_end > trim_start and text[trim_end - 1].isspace():
+                trim_end -= 1
+
+            if trim_start < trim_end:
+                yield start_pos, end_pos, trim_start, trim_end
+
             # Move start position, accounting for overlap
             start_pos = max(start_pos + chunk_size - chunk_overlap, end_pos)
-        
-        # Update total chunks in metadata
-        for chunk in chunks:
-            chunk["metadata"]["total_chunks"] = len(chunks)
-        
-        return chunks
+
+    def chunk_stream(self, text: str, filename: str = "", chunk_size: int = None, chunk_overlap: int = None):
+        """Lazily yield chunks; bounds are computed first so total_chunks is known."""
+        if chunk_size is None:
+            chunk_size = SETTINGS.chunk_size
+        if chunk_overlap is None:
+            chunk_overlap = SETTINGS.chunk_overlap
+
+        # First pass over bounds is cheap (index tuples, no string copies)
+        bounds = list(self._iter_chunk_bounds(text, chunk_size, chunk_overlap))
+        total_chunks = len(bounds)
+
+        for chunk_index, (start_pos, end_pos, trim_start, trim_end) in enumerate(bounds):
+            yield {
+                "content": text[trim_start:trim_end],
+                "chunk_index": chunk_index,
+                "start_char": start_pos,
+                "end_char": end_pos,
+                "metadata": {
+                    "filename": filename,
+                    "chunk_size": trim_end - trim_start,
+                    "total_chunks": total_chunks
+                }
+            }
+
+    def chunk_text(self, text: str, filename: str = "", chunk_size: int = None, chunk_overlap: int = None) -> List[Dict[str, Any]]:
+        """Split text into chunks for vector storage."""
+        return list(self.chunk_stream(text, filename, chunk_size, chunk_overlap))
     
     def delete_file(self, file_path: str) -> bool:
         """Delete a file from storage."""
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
+                # Drop any warm PDF handle pointing at the removed file
+                _open_pdf.cache_clear()
                 return True
             return False
         except Exception as e:
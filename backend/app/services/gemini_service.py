@@ -1,6 +1,7 @@
 import google.generativeai as genai
 from typing import List, Dict, Any
 import asyncio
+import json
 import time
 from app.core.config import settings
 
@@ -8,7 +9,11 @@ class GeminiService:
     def __init__(self):
         genai.configure(api_key=settings.gemini_api_key)
         self.model = genai.GenerativeModel('gemini-2.0-flash')
-        
+
+    async def _generate_content(self, prompt: str, **kwargs):
+        """Generate content through the native async Gemini client."""
+        return await self.model.generate_content_async(prompt, **kwargs)
+
     async def generate_response(self, prompt: str, context: str = "") -> str:
         """Generate response using Gemini AI with optional context."""
         try:
@@ -21,9 +26,7 @@ class GeminiService:
             If the context doesn't contain relevant information, say so clearly.
             """
             
-            response = await asyncio.to_thread(
-                self.model.generate_content, full_prompt
-            )
+            response = await self._generate_content(full_prompt)
             return response.text
             
         except Exception as e:
@@ -34,55 +37,26 @@ class GeminiService:
         """Generate document summary with key points."""
         try:
             prompt = f"""
-            Please analyze the following document and provide:
-            1. A concise summary (max {max_length} words)
-            2. 5-7 key points from the document
-            3. Main themes or topics covered
-            
+            Please analyze the following document and respond with a JSON object
+            containing:
+            - "summary": a concise summary (max {max_length} words)
+            - "key_points": a list of 5-7 key points from the document
+            - "themes": a list of main themes or topics covered
+
             Document text:
-            {text[:8000]}  # Limit text to avoid token limits
-            
-            Format your response as:
-            SUMMARY: [your summary here]
-            KEY_POINTS:
-            - [point 1]
-            - [point 2]
-            - [etc.]
-            THEMES: [main themes separated by commas]
+            {text[:8000]}
             """
-            
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
+
+            response = await self._generate_content(
+                prompt,
+                generation_config={"response_mime_type": "application/json"}
             )
-            
-            # Parse the response
-            response_text = response.text
-            summary = ""
-            key_points = []
-            themes = []
-            
-            lines = response_text.split('\n')
-            current_section = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('SUMMARY:'):
-                    summary = line.replace('SUMMARY:', '').strip()
-                    current_section = 'summary'
-                elif line.startswith('KEY_POINTS:'):
-                    current_section = 'key_points'
-                elif line.startswith('THEMES:'):
-                    themes = [t.strip() for t in line.replace('THEMES:', '').split(',')]
-                    current_section = 'themes'
-                elif line.startswith('- ') and current_section == 'key_points':
-                    key_points.append(line.replace('- ', ''))
-                elif current_section == 'summary' and line:
-                    summary += ' ' + line
-            
+
+            data = json.loads(response.text)
             return {
-                "summary": summary.strip(),
-                "key_points": key_points,
-                "themes": themes
+                "summary": str(data.get("summary", "")).strip(),
+                "key_points": list(data.get("key_points", [])),
+                "themes": list(data.get("themes", []))
             }
             
         except Exception as e:
@@ -96,62 +70,40 @@ class GeminiService:
     async def compare_documents(self, doc_contents: List[str], doc_names: List[str]) -> Dict[str, Any]:
         """Compare multiple documents and find similarities/differences."""
         try:
-            # Limit content length for each document
-            limited_contents = [content[:3000] for content in doc_contents]
-            
+            # Map: summarize each document in parallel so no document is
+            # truncated to fit a single large-context prompt
+            doc_summaries = await asyncio.gather(
+                *[self.generate_summary(content) for content in doc_contents]
+            )
+
+            digests = json.dumps([
+                {"name": name, **summary}
+                for name, summary in zip(doc_names, doc_summaries)
+            ])
+
+            # Reduce: compare the compact per-document digests in one small prompt
             prompt = f"""
-            Compare the following documents and identify:
-            1. Key similarities between them
-            2. Major differences
-            3. Common themes or topics
-            4. Unique aspects of each document
-            
-            Documents:
-            {chr(10).join([f"Document {i+1} ({doc_names[i]}): {content}" for i, content in enumerate(limited_contents)])}
-            
-            Format your response as:
-            SIMILARITIES:
-            - [similarity 1]
-            - [similarity 2]
-            
-            DIFFERENCES:
-            - [difference 1]
-            - [difference 2]
-            
-            COMMON_THEMES: [themes separated by commas]
+            The following JSON array contains summaries, key points and themes
+            extracted from several documents. Compare them and respond with a
+            JSON object containing:
+            - "similarities": a list of key similarities between the documents
+            - "differences": a list of major differences
+            - "common_themes": a list of common themes or topics
+
+            Document digests:
+            {digests}
             """
-            
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
+
+            response = await self._generate_content(
+                prompt,
+                generation_config={"response_mime_type": "application/json"}
             )
-            
-            # Parse response similar to summary
-            response_text = response.text
-            similarities = []
-            differences = []
-            common_themes = []
-            
-            lines = response_text.split('\n')
-            current_section = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('SIMILARITIES:'):
-                    current_section = 'similarities'
-                elif line.startswith('DIFFERENCES:'):
-                    current_section = 'differences'
-                elif line.startswith('COMMON_THEMES:'):
-                    common_themes = [t.strip() for t in line.replace('COMMON_THEMES:', '').split(',')]
-                elif line.startswith('- '):
-                    if current_section == 'similarities':
-                        similarities.append(line.replace('- ', ''))
-                    elif current_section == 'differences':
-                        differences.append(line.replace('- ', ''))
-            
+
+            data = json.loads(response.text)
             return {
-                "similarities": similarities,
-                "differences": differences,
-                "common_themes": common_themes
+                "similarities": list(data.get("similarities", [])),
+                "differences": list(data.get("differences", [])),
+                "common_themes": list(data.get("common_themes", []))
             }
             
         except Exception as e:
@@ -174,9 +126,7 @@ class GeminiService:
             else:
                 prompt = f"Extract the most important information and facts from this text: {text[:4000]}"
             
-            response = await asyncio.to_thread(
-                self.model.generate_content, prompt
-            )
+            response = await self._generate_content(prompt)
             
             return {"extracted_info": response.text}
             
@@ -1,40 +1,159 @@
+import asyncio
+import json
+import os
+import sqlite3
 import uuid
 import time
+from collections import OrderedDict, deque
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from app.core.config import settings
 from app.services.document_processor import document_processor
 from app.services.vector_store import vector_store
 from app.services.gemini_service import gemini_service
 from app.models.document import DocumentResponse, DocumentSummary
 from app.models.chat import ChatResponse, ChatSource
 
+# Recently re-read document texts kept around for summaries/comparisons
+_TEXT_CACHE_SIZE = 32
+
+# Memoized Gemini results (summaries/comparisons) keyed by content digest
+_RESULT_CACHE_SIZE = 1024
+
+def _chunk_preview(content: str, limit: int = 200) -> str:
+    """Short preview of chunk content for source attribution."""
+    return content[:limit] + "..." if len(content) > limit else content
+
 class RAGService:
     def __init__(self):
         self.documents_store = {}  # In-memory store for document metadata
-        self.chat_history = {}     # In-memory store for chat history
+        # LRU of per-document chat history; deques bound history per doc and
+        # the OrderedDict bounds the number of tracked documents
+        self.chat_history = OrderedDict()
+        self._digest_index_path = os.path.join(settings.upload_dir, "digest_index.json")
+        self._digest_index = self._load_digest_index()  # file digest -> document_id
+        self._text_cache = OrderedDict()  # (file_path, mtime) -> text
+
+        # Content-keyed cache of Gemini results, backed by SQLite so
+        # restarts don't pay for the same summaries again
+        self._result_cache = OrderedDict()
+        self._result_db = sqlite3.connect(
+            os.path.join(settings.upload_dir, "result_cache.db"),
+            check_same_thread=False
+        )
+        self._result_db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, payload TEXT)"
+        )
+        self._result_db.commit()
+
+    def _result_cache_get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Look up a memoized Gemini result in memory, then SQLite."""
+        if key is None:
+            return None
+        value = self._result_cache.get(key)
+        if value is not None:
+            self._result_cache.move_to_end(key)
+            return value
+        try:
+            row = self._result_db.execute(
+                "SELECT payload FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row:
+            value = json.loads(row[0])
+            self._result_cache[key] = value
+            return value
+        return None
+
+    def _result_cache_put(self, key: Optional[str], value: Dict[str, Any]):
+        """Memoize a Gemini result in memory and SQLite."""
+        if key is None:
+            return
+        self._result_cache[key] = value
+        if len(self._result_cache) > _RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+        try:
+            self._result_db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?)", (key, json.dumps(value))
+            )
+            self._result_db.commit()
+        except sqlite3.Error as e:
+            print(f"Error persisting result cache: {e}")
+
+    async def _get_document_text(self, document_id: str) -> str:
+        """Load a document's text from disk, caching recent reads.
+
+        Full texts are no longer held in documents_store; they live on disk
+        (and as chunks in the vector store), so summaries and comparisons
+        re-extract on demand through a small mtime-keyed LRU.
+        """
+        doc_data = self.documents_store[document_id]
+        file_path = doc_data["file_path"]
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            mtime = 0.0
+
+        key = (file_path, mtime)
+        cached = self._text_cache.get(key)
+        if cached is not None:
+            self._text_cache.move_to_end(key)
+            return cached
+
+        text, _ = await document_processor.extract_text_from_file(
+            file_path, doc_data["document"].filename
+        )
+        self._text_cache[key] = text
+        if len(self._text_cache) > _TEXT_CACHE_SIZE:
+            self._text_cache.popitem(last=False)
+        return text
+
+    def _load_digest_index(self) -> Dict[str, str]:
+        """Load the persisted digest -> document_id index."""
+        try:
+            with open(self._digest_index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_digest_index(self):
+        """Persist the digest -> document_id index."""
+        try:
+            with open(self._digest_index_path, 'w') as f:
+                json.dump(self._digest_index, f)
+        except OSError as e:
+            print(f"Error saving digest index: {e}")
     
-    async def process_document(self, file_content: bytes, filename: str, 
+    async def process_document(self, file, filename: str,
                              content_type: str) -> DocumentResponse:
         """Process uploaded document and store in vector database."""
         try:
             # Generate document ID
             document_id = str(uuid.uuid4())
-            
-            # Save file
-            file_path = await document_processor.save_uploaded_file(file_content, filename)
+
+            # Stream file to disk
+            file_path, file_size, digest = await document_processor.save_uploaded_file(file, filename)
+
+            # Identical content was already processed: skip re-extraction,
+            # re-chunking and re-embedding and return the existing document
+            existing_id = self._digest_index.get(digest)
+            if existing_id and existing_id in self.documents_store:
+                document_processor.delete_file(file_path)
+                return self.documents_store[existing_id]["document"]
             
             # Extract text
-            text, metadata = document_processor.extract_text_from_file(file_path, filename)
+            text, metadata = await document_processor.extract_text_from_file(file_path, filename)
             if not text:
                 raise Exception("Failed to extract text from document")
             
-            # Create text chunks
-            chunks = document_processor.chunk_text(text, filename)
+            # Create text chunks off the event loop
+            chunks = await asyncio.to_thread(document_processor.chunk_text, text, filename)
             if not chunks:
                 raise Exception("Failed to create text chunks")
-            
-            # Store chunks in vector database
-            success = vector_store.add_document_chunks(document_id, chunks, filename)
+
+            # Store chunks in vector database, overlapping encode with writes
+            success = await vector_store.add_document_chunks_async(document_id, chunks, filename)
             if not success:
                 raise Exception("Failed to store document in vector database")
             
@@ -43,10 +162,10 @@ class RAGService:
                 id=document_id,
                 filename=filename,
                 content_type=content_type,
-                size=len(file_content),
+                size=file_size,
                 upload_date=datetime.now(),
                 page_count=metadata.get("page_count"),
-                word_count=metadata.get("word_count", len(text.split())),
+                word_count=metadata.get("word_count", 0),
                 status="processed"
             )
             
@@ -54,11 +173,14 @@ class RAGService:
             self.documents_store[document_id] = {
                 "document": doc_response,
                 "file_path": file_path,
-                "text": text,
                 "metadata": metadata,
-                "chunks_count": len(chunks)
+                "chunks_count": len(chunks),
+                "digest": digest
             }
-            
+
+            self._digest_index[digest] = document_id
+            self._save_digest_index()
+
             return doc_response
             
         except Exception as e:
@@ -72,17 +194,23 @@ class RAGService:
                 raise Exception("Document not found")
             
             doc_data = self.documents_store[document_id]
-            text = doc_data["text"]
-            
-            # Generate summary using Gemini
-            summary_data = await gemini_service.generate_summary(text)
-            
-            # Create summary response
+
+            # Summaries are content-addressed: identical text (keyed by the
+            # content digest computed at ingest) never hits Gemini twice
+            cache_key = doc_data.get("digest")
+            summary_data = self._result_cache_get(cache_key)
+            if summary_data is None:
+                text = await self._get_document_text(document_id)
+                summary_data = await gemini_service.generate_summary(text)
+                if summary_data.get("key_points"):
+                    self._result_cache_put(cache_key, summary_data)
+
+            # Create summary response (word count was computed at ingest)
             summary = DocumentSummary(
                 document_id=document_id,
                 summary=summary_data["summary"],
                 key_points=summary_data["key_points"],
-                word_count=len(text.split()),
+                word_count=doc_data["document"].word_count or 0,
                 generated_at=datetime.now()
             )
             
@@ -106,7 +234,8 @@ class RAGService:
             )
             
             if not relevant_chunks:
-                return ChatResponse(
+                # model_construct skips validation; all fields are trusted here
+                return ChatResponse.model_construct(
                     question=question,
                     answer="I couldn't find relevant information in the uploaded documents to answer your question.",
                     sources=[],
@@ -114,31 +243,28 @@ class RAGService:
                     timestamp=datetime.now(),
                     document_ids=document_ids or []
                 )
-            
-            # Prepare context from relevant chunks
-            context_parts = []
-            sources = []
-            
-            for chunk in relevant_chunks:
-                context_parts.append(f"From {chunk['filename']}:\n{chunk['content']}")
-                
-                # Create source information
-                source = ChatSource(
+
+            # Prepare context and source attributions in single passes
+            context = "\n\n---\n\n".join(
+                f"From {chunk['filename']}:\n{chunk['content']}"
+                for chunk in relevant_chunks
+            )
+            sources = [
+                ChatSource.model_construct(
                     document_id=chunk["document_id"],
                     document_name=chunk["filename"],
                     page_number=chunk["metadata"].get("page_number"),
-                    chunk_text=chunk["content"][:200] + "..." if len(chunk["content"]) > 200 else chunk["content"],
+                    chunk_text=_chunk_preview(chunk["content"]),
                     relevance_score=chunk["similarity_score"]
                 )
-                sources.append(source)
-            
-            context = "\n\n---\n\n".join(context_parts)
-            
+                for chunk in relevant_chunks
+            ]
+
             # Generate answer using Gemini
             answer = await gemini_service.generate_response(question, context)
-            
+
             # Create chat response
-            chat_response = ChatResponse(
+            chat_response = ChatResponse.model_construct(
                 question=question,
                 answer=answer,
                 sources=sources,
@@ -147,18 +273,24 @@ class RAGService:
                 document_ids=document_ids or []
             )
             
-            # Store in chat history
+            # Store in chat history (bounded per doc and across docs)
             if document_ids:
                 for doc_id in document_ids:
-                    if doc_id not in self.chat_history:
-                        self.chat_history[doc_id] = []
-                    self.chat_history[doc_id].append(chat_response)
+                    history = self.chat_history.get(doc_id)
+                    if history is None:
+                        history = self.chat_history[doc_id] = deque(
+                            maxlen=settings.chat_history_max_per_doc
+                        )
+                    history.append(chat_response)
+                    self.chat_history.move_to_end(doc_id)
+                while len(self.chat_history) > settings.chat_history_max_docs:
+                    self.chat_history.popitem(last=False)
             
             return chat_response
             
         except Exception as e:
             print(f"Error answering question: {e}")
-            return ChatResponse(
+            return ChatResponse.model_construct(
                 question=question,
                 answer=f"I encountered an error while processing your question: {str(e)}",
                 sources=[],
@@ -173,22 +305,35 @@ class RAGService:
             if len(document_ids) < 2:
                 raise Exception("At least 2 documents are required for comparison")
             
-            # Get document contents
-            doc_contents = []
-            doc_names = []
-            
             for doc_id in document_ids:
                 if doc_id not in self.documents_store:
                     raise Exception(f"Document {doc_id} not found")
-                
-                doc_data = self.documents_store[doc_id]
-                doc_contents.append(doc_data["text"])
-                doc_names.append(doc_data["document"].filename)
-            
-            # Use Gemini to compare documents
-            comparison_result = await gemini_service.compare_documents(doc_contents, doc_names)
-            
-            # Add document metadata
+
+            doc_names = [
+                self.documents_store[doc_id]["document"].filename
+                for doc_id in document_ids
+            ]
+
+            # Comparisons are memoized on the sorted content digests, so the
+            # same set of documents compares once regardless of order
+            digests = [self.documents_store[doc_id].get("digest") for doc_id in document_ids]
+            cache_key = "cmp:" + ":".join(sorted(digests)) if all(digests) else None
+
+            comparison_result = self._result_cache_get(cache_key)
+            if comparison_result is None:
+                # Load document contents concurrently rather than one by one
+                doc_contents = await asyncio.gather(
+                    *[self._get_document_text(doc_id) for doc_id in document_ids]
+                )
+
+                # Use Gemini to compare documents
+                comparison_result = await gemini_service.compare_documents(doc_contents, doc_names)
+                if comparison_result.get("similarities") or comparison_result.get("differences"):
+                    self._result_cache_put(cache_key, comparison_result)
+            
+            # Add document metadata on a copy so the cached entry stays
+            # free of per-request document ids
+            comparison_result = dict(comparison_result)
             comparison_result["documents"] = [
                 {
                     "id": doc_id,
@@ -228,9 +373,13 @@ class RAGService:
             # Delete file
             document_processor.delete_file(doc_data["file_path"])
             
-            # Remove from store
+            # Remove from store and drop the dedup entry
             del self.documents_store[document_id]
-            
+            digest = doc_data.get("digest")
+            if digest and self._digest_index.get(digest) == document_id:
+                del self._digest_index[digest]
+                self._save_digest_index()
+
             # Clean up chat history
             if document_id in self.chat_history:
                 del self.chat_history[document_id]
@@ -243,7 +392,7 @@ class RAGService:
     
     def get_chat_history(self, document_id: str) -> List[ChatResponse]:
         """Get chat history for a document."""
-        return self.chat_history.get(document_id, [])
+        return list(self.chat_history.get(document_id, ()))
     
     def clear_chat_history(self, document_id: str) -> bool:
         """Clear chat history for a document."""
@@ -1,5 +1,12 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
 import chromadb
 from chromadb.config import Settings
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any, Optional, Tuple
 import uuid
@@ -7,6 +14,79 @@ import json
 from datetime import datetime
 from app.core.config import settings
 
+# Bounded cache of query embeddings; repeat questions skip the encoder
+_QUERY_CACHE_SIZE = 2048
+
+_WHITESPACE = re.compile(r'\s+')
+
+def _query_cache_key(text: str) -> bytes:
+    """Cache key for a query; near-duplicates (case/whitespace) collapse."""
+    normalized = _WHITESPACE.sub(' ', text.strip().lower())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+try:
+    from fastembed import TextEmbedding
+except ImportError:
+    TextEmbedding = None
+
+class FastEmbedEncoder:
+    """SentenceTransformer-style encode() over fastembed's quantized ONNX models."""
+
+    def __init__(self, model_name: str):
+        if '/' not in model_name:
+            model_name = f"sentence-transformers/{model_name}"
+        self._model = TextEmbedding(model_name=model_name, threads=os.cpu_count())
+
+    def encode(self, texts: List[str], batch_size: int = 256,
+               normalize_embeddings: bool = False, **kwargs):
+        embeddings = np.array(list(self._model.embed(texts, batch_size=batch_size)),
+                              dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings
+
+def _cpu_supports_bf16() -> bool:
+    """Detect AMX/AVX-512 BF16 support from the CPU flags."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+        return 'amx_bf16' in flags or 'avx512_bf16' in flags
+    except OSError:
+        return False
+
+def _load_embedding_model():
+    """Load the configured embedding backend, preferring quantized ONNX on CPU."""
+    precision = settings.embedding_precision
+    if precision == "auto":
+        # On AMX/AVX-512-BF16 hosts, BF16 weights beat INT8 at serving batch
+        # sizes because INT8 pays a dequantization cost per forward pass
+        precision = "bf16" if _cpu_supports_bf16() else "int8"
+
+    if precision == "bf16":
+        try:
+            import torch
+            return SentenceTransformer(
+                settings.embedding_model,
+                model_kwargs={"torch_dtype": torch.bfloat16}
+            )
+        except Exception as e:
+            print(f"Error loading BF16 embedding model, falling back to INT8: {e}")
+
+    if settings.embedding_backend.startswith("onnx"):
+        if TextEmbedding is not None:
+            try:
+                return FastEmbedEncoder(settings.embedding_model)
+            except Exception as e:
+                print(f"Error loading fastembed backend: {e}")
+        # sentence-transformers' own ONNX export (via optimum/onnxruntime)
+        # fuses LayerNorm/GELU/matmul and drops the eager-PyTorch overhead
+        try:
+            return SentenceTransformer(settings.embedding_model, backend="onnx")
+        except Exception as e:
+            print(f"Error loading ONNX embedding backend, falling back to torch: {e}")
+    return SentenceTransformer(settings.embedding_model)
+
 class VectorStore:
     def __init__(self):
         # Initialize ChromaDB client
@@ -16,68 +96,381 @@ class VectorStore:
         )
         
         # Initialize embedding model
-        self.embedding_model = SentenceTransformer(settings.embedding_model)
+        self.embedding_model = _load_embedding_model()
         
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
             name="documents",
             metadata={"hnsw:space": "cosine"}
         )
-    
-    def add_document_chunks(self, document_id: str, chunks: List[Dict[str, Any]], 
+
+        # LRU of recent query embeddings (cache key -> ndarray)
+        self._query_cache = OrderedDict()
+
+        # In-process mirror of the collection for the hot search path: a
+        # brute-force inner-product scan over one contiguous float32 matrix
+        # (a single BLAS matvec) instead of Chroma's HNSW + SQLite per query.
+        # Chroma remains the source of truth for persistence and metadata.
+        self._index_matrix: Optional[np.ndarray] = None  # (N, dim), L2-normalized
+        self._index_ids: List[str] = []
+        self._index_docs: List[str] = []
+        self._index_metas: List[Dict[str, Any]] = []
+        self._doc_rows: Dict[str, List[int]] = {}  # document_id -> matrix rows
+
+        # Incrementally maintained stats so get_collection_stats is O(1)
+        self._chunk_count = 0
+        self._doc_id_set = set()
+
+        # Mean-pooled embedding per document, stacked lazily into a
+        # (N_docs, dim) matrix for document-level similarity
+        self.doc_embeddings: Dict[str, np.ndarray] = {}
+        self._doc_matrix: Optional[np.ndarray] = None
+        self._doc_matrix_ids: List[str] = []
+
+        # Index mutations run on worker threads (add_document_chunks_async)
+        # while searches run on the event loop; one reentrant lock keeps the
+        # matrix and the id/doc/meta lists in step
+        self._index_lock = threading.RLock()
+        self._seed_index()
+
+    def _rebuild_doc_rows(self):
+        """Recompute the document_id -> matrix row mapping."""
+        doc_rows: Dict[str, List[int]] = {}
+        for i, meta in enumerate(self._index_metas):
+            doc_rows.setdefault(meta["document_id"], []).append(i)
+        self._doc_rows = doc_rows
+
+    def _update_doc_embedding(self, document_id: str):
+        """Recompute a document's mean-pooled embedding from its chunk rows."""
+        rows = self._doc_rows.get(document_id, [])
+        if not rows:
+            self.doc_embeddings.pop(document_id, None)
+        else:
+            pooled = self._index_matrix[rows].mean(axis=0)
+            pooled /= max(float(np.linalg.norm(pooled)), 1e-12)
+            self.doc_embeddings[document_id] = pooled
+        self._doc_matrix = None  # rebuilt lazily
+
+    def _get_doc_matrix(self) -> Tuple[Optional[np.ndarray], List[str]]:
+        """Get the stacked document-embedding matrix, rebuilding if stale."""
+        if self._doc_matrix is None and self.doc_embeddings:
+            self._doc_matrix_ids = list(self.doc_embeddings.keys())
+            self._doc_matrix = np.stack(
+                [self.doc_embeddings[doc_id] for doc_id in self._doc_matrix_ids]
+            )
+        return self._doc_matrix, self._doc_matrix_ids
+
+    def _sidecar_paths(self) -> Tuple[str, str]:
+        base = settings.chroma_persist_dir
+        return (os.path.join(base, "embeddings.f16.npy"),
+                os.path.join(base, "embeddings_meta.json"))
+
+    def _save_index_sidecar(self):
+        """Persist the in-memory index so restarts skip the Chroma rebuild.
+
+        Embeddings go to disk as FP16 (half the bytes at negligible cosine
+        loss); ids, chunk texts and metadata go to a JSON sidecar.
+        """
+        emb_path, meta_path = self._sidecar_paths()
+        try:
+            with self._index_lock:
+                if self._index_matrix is None:
+                    for path in (emb_path, meta_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    return
+                np.save(emb_path, self._index_matrix.astype(np.float16))
+                with open(meta_path, 'w') as f:
+                    json.dump({
+                        "ids": self._index_ids,
+                        "documents": self._index_docs,
+                        "metadatas": self._index_metas
+                    }, f)
+        except Exception as e:
+            print(f"Error saving embedding sidecar: {e}")
+
+    def _load_index_sidecar(self) -> bool:
+        """Load the FP16 embedding sidecar; returns False when absent/stale."""
+        emb_path, meta_path = self._sidecar_paths()
+        try:
+            if not (os.path.exists(emb_path) and os.path.exists(meta_path)):
+                return False
+            with open(meta_path) as f:
+                meta = json.load(f)
+            matrix = np.load(emb_path, mmap_mode='r')
+            if len(meta["ids"]) != matrix.shape[0]:
+                return False
+            # A crash between a Chroma write/delete and the sidecar save
+            # leaves the sidecar stale; Chroma is the source of truth, so
+            # rebuild from it whenever the row counts disagree
+            if len(meta["ids"]) != self.collection.count():
+                return False
+            # Upcast once in RAM so the per-query matvec stays full-speed BLAS
+            self._index_matrix = np.asarray(matrix, dtype=np.float32)
+            self._index_ids = meta["ids"]
+            self._index_docs = meta["documents"]
+            self._index_metas = meta["metadatas"]
+            return True
+        except Exception as e:
+            print(f"Error loading embedding sidecar: {e}")
+            return False
+
+    def _seed_index(self):
+        """Load the persisted collection into the in-memory index."""
+        try:
+            if not self._load_index_sidecar():
+                results = self.collection.get(include=["documents", "metadatas", "embeddings"])
+                if results["ids"] is not None and len(results["ids"]) > 0:
+                    self._index_ids = list(results["ids"])
+                    self._index_docs = list(results["documents"])
+                    self._index_metas = list(results["metadatas"])
+                    matrix = np.asarray(results["embeddings"], dtype=np.float32)
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    self._index_matrix = matrix / np.maximum(norms, 1e-12)
+
+            if self._index_matrix is not None:
+                self._rebuild_doc_rows()
+                self._chunk_count = len(self._index_ids)
+                self._doc_id_set = {meta["document_id"] for meta in self._index_metas}
+                for doc_id in self._doc_id_set:
+                    self._update_doc_embedding(doc_id)
+        except Exception as e:
+            print(f"Error seeding in-memory index: {e}")
+
+    def _append_to_index(self, ids: List[str], documents: List[str],
+                         metadatas: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Mirror freshly added chunks into the in-memory index."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._index_lock:
+            if self._index_matrix is None:
+                self._index_matrix = embeddings.copy()
+            else:
+                self._index_matrix = np.vstack([self._index_matrix, embeddings])
+            start_row = len(self._index_ids)
+            self._index_ids.extend(ids)
+            self._index_docs.extend(documents)
+            self._index_metas.extend(metadatas)
+            for offset, metadata in enumerate(metadatas):
+                self._doc_rows.setdefault(metadata["document_id"], []).append(start_row + offset)
+            self._chunk_count += len(ids)
+            added_doc_ids = {metadata["document_id"] for metadata in metadatas}
+            self._doc_id_set |= added_doc_ids
+            for doc_id in added_doc_ids:
+                self._update_doc_embedding(doc_id)
+
+    def _remove_document_from_index(self, document_id: str):
+        """Drop all of a document's rows from the in-memory index."""
+        with self._index_lock:
+            if self._index_matrix is None:
+                return
+            keep = [i for i, meta in enumerate(self._index_metas)
+                    if meta.get("document_id") != document_id]
+            if len(keep) == len(self._index_ids):
+                return
+            self._index_ids = [self._index_ids[i] for i in keep]
+            self._index_docs = [self._index_docs[i] for i in keep]
+            self._index_metas = [self._index_metas[i] for i in keep]
+            self._index_matrix = self._index_matrix[keep] if keep else None
+            self._rebuild_doc_rows()  # surviving rows shifted down
+            self._chunk_count = len(self._index_ids)
+            self._doc_id_set.discard(document_id)
+            self.doc_embeddings.pop(document_id, None)
+            self._doc_matrix = None
+
+    def _search_index(self, query_embedding: np.ndarray,
+                      document_ids: Optional[List[str]], top_k: int,
+                      exclude_document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Brute-force inner-product search over the in-memory index."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        with self._index_lock:
+            candidate_rows = None
+            if document_ids:
+                # Filter push-down: score only the selected documents' rows, so
+                # cost scales with the filtered subset rather than the whole index
+                excluded = set(exclude_document_ids) if exclude_document_ids else ()
+                rows = []
+                for doc_id in document_ids:
+                    if doc_id not in excluded:
+                        rows.extend(self._doc_rows.get(doc_id, ()))
+                if not rows:
+                    return []
+                candidate_rows = np.asarray(rows, dtype=np.intp)
+                scores = self._index_matrix[candidate_rows] @ query
+            else:
+                scores = self._index_matrix @ query
+                if exclude_document_ids:
+                    excluded = set(exclude_document_ids)
+                    mask = np.fromiter(
+                        (meta["document_id"] not in excluded for meta in self._index_metas),
+                        dtype=bool, count=len(self._index_metas)
+                    )
+                    scores = np.where(mask, scores, -np.inf)
+
+            top_k = min(top_k, len(scores))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+
+            chunks = []
+            for i in top:
+                if candidate_rows is not None:
+                    score, i = scores[i], candidate_rows[i]
+                else:
+                    score = scores[i]
+                if not np.isfinite(score):
+                    continue
+                metadata = self._index_metas[i]
+                chunks.append({
+                    "content": self._index_docs[i],
+                    "metadata": metadata,
+                    "similarity_score": float(score),
+                    "document_id": metadata["document_id"],
+                    "filename": metadata["filename"],
+                    "chunk_index": metadata["chunk_index"]
+                })
+            return chunks
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing cached vectors for repeat questions.
+
+        The MiniLM forward pass dominates latency for short chat queries,
+        so repeat and near-duplicate questions are served from the cache.
+        """
+        key = _query_cache_key(query)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+
+        embedding = np.asarray(self.embedding_model.encode([query])[0])
+        self._query_cache[key] = embedding
+        if len(self._query_cache) > _QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return embedding
+
+    def _encode_batch(self, document_id: str, chunks: List[Dict[str, Any]],
+                      filename: str, start_index: int, created_at: str):
+        """Prepare ids/documents/metadata for a batch of chunks and encode them."""
+        ids = []
+        documents = []
+        metadatas = []
+
+        for i, chunk in enumerate(chunks, start=start_index):
+            ids.append(f"{document_id}_{i}")
+            documents.append(chunk["content"])
+            metadatas.append({
+                "document_id": document_id,
+                "filename": filename,
+                "chunk_index": chunk["chunk_index"],
+                "start_char": chunk["start_char"],
+                "end_char": chunk["end_char"],
+                "created_at": created_at,
+                **chunk.get("metadata", {})
+            })
+
+        # Pre-normalized so cosine similarity reduces to a dot product;
+        # keep the ndarray as-is
+        embeddings = self.embedding_model.encode(
+            documents,
+            batch_size=settings.embedding_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return ids, documents, metadatas, embeddings
+
+    def _add_batch(self, ids: List[str], documents: List[str],
+                   metadatas: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Write an encoded batch to ChromaDB and the in-memory index."""
+        self.collection.add(
+            ids=ids,
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas
+        )
+        self._append_to_index(ids, documents, metadatas, embeddings)
+
+    def add_document_chunks(self, document_id: str, chunks: List[Dict[str, Any]],
                           filename: str) -> bool:
         """Add document chunks to vector store."""
         try:
-            # Prepare data for ChromaDB
-            ids = []
-            documents = []
-            metadatas = []
-            
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{document_id}_{i}"
-                ids.append(chunk_id)
-                documents.append(chunk["content"])
-                
-                # Prepare metadata
-                metadata = {
-                    "document_id": document_id,
-                    "filename": filename,
-                    "chunk_index": chunk["chunk_index"],
-                    "start_char": chunk["start_char"],
-                    "end_char": chunk["end_char"],
-                    "created_at": datetime.now().isoformat(),
-                    **chunk.get("metadata", {})
-                }
-                metadatas.append(metadata)
-            
-            # Generate embeddings
-            embeddings = self.embedding_model.encode(documents).tolist()
-            
-            # Add to ChromaDB
-            self.collection.add(
-                ids=ids,
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas
-            )
-            
+            # One timestamp per ingest; every chunk shares it
+            created_at = datetime.now().isoformat()
+            self._add_batch(*self._encode_batch(document_id, chunks, filename, 0, created_at))
+            self._save_index_sidecar()
             return True
-            
+
         except Exception as e:
             print(f"Error adding document chunks: {e}")
+            # Remove anything already written so no orphaned chunks linger
+            self.delete_document_chunks(document_id)
             return False
-    
-    def search_similar_chunks(self, query: str, document_ids: Optional[List[str]] = None, 
-                            top_k: int = 5) -> List[Dict[str, Any]]:
+
+    async def add_document_chunks_async(self, document_id: str,
+                                        chunks: List[Dict[str, Any]],
+                                        filename: str) -> bool:
+        """Add chunks in mini-batches, overlapping encoding with DB writes.
+
+        Encoding batch N runs on a worker thread while batch N-1 is being
+        written to ChromaDB, and the event loop stays free throughout.
+        """
+        add_task = None
+        try:
+            batch_size = settings.embedding_batch_size
+            # One timestamp per ingest; every batch shares it
+            created_at = datetime.now().isoformat()
+
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                prepared = await asyncio.to_thread(
+                    self._encode_batch, document_id, batch, filename, start, created_at
+                )
+                if add_task is not None:
+                    await add_task
+                add_task = asyncio.create_task(
+                    asyncio.to_thread(self._add_batch, *prepared)
+                )
+
+            if add_task is not None:
+                await add_task
+            await asyncio.to_thread(self._save_index_sidecar)
+            return True
+
+        except Exception as e:
+            print(f"Error adding document chunks: {e}")
+            # Earlier batches are already in Chroma and the index; roll them
+            # back so a failed ingest leaves no orphaned searchable chunks
+            if add_task is not None:
+                try:
+                    await add_task
+                except Exception:
+                    pass
+            await asyncio.to_thread(self.delete_document_chunks, document_id)
+            return False
+
+    def search_similar_chunks(self, query: str, document_ids: Optional[List[str]] = None,
+                            top_k: int = 5,
+                            exclude_document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Search for similar chunks using semantic similarity."""
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode([query]).tolist()
-            
+            # Generate query embedding (cached for repeat queries)
+            query_embedding = self._encode_query(query)
+
+            # Serve from the in-memory index when available
+            if self._index_matrix is not None and len(self._index_ids) > 0:
+                return self._search_index(query_embedding, document_ids, top_k,
+                                          exclude_document_ids)
+
+            # Fallback: query ChromaDB directly
+            query_embedding = [query_embedding.tolist()]
+
             # Prepare where clause for filtering by document IDs
             where_clause = None
             if document_ids:
                 where_clause = {"document_id": {"$in": document_ids}}
+            elif exclude_document_ids:
+                where_clause = {"document_id": {"$nin": exclude_document_ids}}
             
             # Search in ChromaDB
             results = self.collection.query(
@@ -138,15 +531,19 @@ class VectorStore:
     def delete_document_chunks(self, document_id: str) -> bool:
         """Delete all chunks for a specific document."""
         try:
-            # Get all chunk IDs for the document
+            # Get all chunk IDs for the document; ids are always returned,
+            # so skip pulling the chunk texts off disk just to delete them
             results = self.collection.get(
                 where={"document_id": document_id},
-                include=["documents"]
+                include=[]
             )
             
             if results["ids"]:
                 self.collection.delete(ids=results["ids"])
-            
+
+            self._remove_document_from_index(document_id)
+            self._save_index_sidecar()
+
             return True
             
         except Exception as e:
@@ -156,18 +553,10 @@ class VectorStore:
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store."""
         try:
-            count = self.collection.count()
-            
-            # Get unique documents
-            results = self.collection.get(include=["metadatas"])
-            unique_docs = set()
-            if results["metadatas"]:
-                for metadata in results["metadatas"]:
-                    unique_docs.add(metadata["document_id"])
-            
+            # Counters are maintained incrementally; no per-call DB scan
             return {
-                "total_chunks": count,
-                "unique_documents": len(unique_docs),
+                "total_chunks": self._chunk_count,
+                "unique_documents": len(self._doc_id_set),
                 "embedding_model": settings.embedding_model,
                 "collection_name": self.collection.name
             }
@@ -179,51 +568,104 @@ class VectorStore:
     def find_similar_documents(self, document_id: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """Find documents similar to a given document."""
         try:
-            # Get chunks from the source document
-            source_chunks = self.get_document_chunks(document_id)
-            if not source_chunks:
+            # Fast path: one matvec over the cached per-document embeddings,
+            # no encoder call and no chunk-level search at all
+            with self._index_lock:
+                doc_embedding = self.doc_embeddings.get(document_id)
+                if doc_embedding is not None:
+                    doc_matrix, doc_ids = self._get_doc_matrix()
+                    scores = doc_matrix @ doc_embedding
+
+                    similar_docs = []
+                    for i in np.argsort(-scores):
+                        other_id = doc_ids[i]
+                        if other_id == document_id:
+                            continue
+                        chunk_rows = self._doc_rows.get(other_id, [])
+                        if not chunk_rows:
+                            continue
+                        similarity = float(scores[i])
+                        similar_docs.append({
+                            "document_id": other_id,
+                            "filename": self._index_metas[chunk_rows[0]]["filename"],
+                            "average_similarity": similarity,
+                            "matching_chunks": len(chunk_rows),
+                            "sample_chunks": [
+                                {
+                                    "content": self._index_docs[j],
+                                    "metadata": self._index_metas[j],
+                                    "similarity_score": similarity,
+                                    "document_id": other_id,
+                                    "filename": self._index_metas[j]["filename"],
+                                    "chunk_index": self._index_metas[j]["chunk_index"]
+                                }
+                                for j in chunk_rows[:2]
+                            ]
+                        })
+                        if len(similar_docs) == top_k:
+                            break
+                    return similar_docs
+
+                if self._index_matrix is not None and len(self._index_ids) > 0:
+                    rows = self._doc_rows.get(document_id, [])
+                    if not rows:
+                        return []
+
+                    # Mean-pool the document's chunk embeddings: one vector
+                    # query instead of re-encoding concatenated chunk text
+                    doc_embedding = self._index_matrix[rows].mean(axis=0)
+                    similar_chunks = self._search_index(
+                        doc_embedding, None, top_k * 3,
+                        exclude_document_ids=[document_id]
+                    )
+                else:
+                    similar_chunks = None
+
+            if similar_chunks is None:
+                # Fallback: use the first few chunks as representative text
+                source_chunks = self.get_document_chunks(document_id)
+                if not source_chunks:
+                    return []
+                representative_text = " ".join([chunk["content"] for chunk in source_chunks[:3]])
+                similar_chunks = self.search_similar_chunks(
+                    query=representative_text,
+                    top_k=top_k * 3,
+                    exclude_document_ids=[document_id]
+                )
+
+            if not similar_chunks:
                 return []
-            
-            # Use the first few chunks as representative text
-            representative_text = " ".join([chunk["content"] for chunk in source_chunks[:3]])
-            
-            # Search for similar chunks in other documents
-            similar_chunks = self.search_similar_chunks(
-                query=representative_text,
-                top_k=top_k * 3  # Get more to filter out the source document
-            )
-            
-            # Group by document and calculate average similarity
-            doc_similarities = {}
-            for chunk in similar_chunks:
-                chunk_doc_id = chunk["document_id"]
-                if chunk_doc_id != document_id:  # Exclude source document
-                    if chunk_doc_id not in doc_similarities:
-                        doc_similarities[chunk_doc_id] = {
-                            "document_id": chunk_doc_id,
-                            "filename": chunk["filename"],
-                            "similarities": [],
-                            "chunks": []
-                        }
-                    doc_similarities[chunk_doc_id]["similarities"].append(chunk["similarity_score"])
-                    doc_similarities[chunk_doc_id]["chunks"].append(chunk)
-            
-            # Calculate average similarity for each document
+
+            # Vectorized per-document aggregation: bincount over integer doc
+            # indices replaces the Python dict-of-lists grouping
+            n_chunks = len(similar_chunks)
+            chunk_doc_ids = [chunk["document_id"] for chunk in similar_chunks]
+            unique_ids = list(dict.fromkeys(chunk_doc_ids))
+            id_to_idx = {doc_id: i for i, doc_id in enumerate(unique_ids)}
+            doc_idx = np.fromiter((id_to_idx[doc_id] for doc_id in chunk_doc_ids),
+                                  dtype=np.intp, count=n_chunks)
+            scores = np.fromiter((chunk["similarity_score"] for chunk in similar_chunks),
+                                 dtype=np.float64, count=n_chunks)
+
+            sums = np.bincount(doc_idx, weights=scores, minlength=len(unique_ids))
+            counts = np.bincount(doc_idx, minlength=len(unique_ids))
+            means = sums / counts
+
+            # Top documents by mean similarity
             similar_docs = []
-            for doc_data in doc_similarities.values():
-                avg_similarity = sum(doc_data["similarities"]) / len(doc_data["similarities"])
+            for i in np.argsort(-means)[:top_k]:
+                doc_id = unique_ids[i]
+                doc_chunks = [chunk for chunk in similar_chunks
+                              if chunk["document_id"] == doc_id]
                 similar_docs.append({
-                    "document_id": doc_data["document_id"],
-                    "filename": doc_data["filename"],
-                    "average_similarity": avg_similarity,
-                    "matching_chunks": len(doc_data["chunks"]),
-                    "sample_chunks": doc_data["chunks"][:2]  # Include a few sample chunks
+                    "document_id": doc_id,
+                    "filename": doc_chunks[0]["filename"],
+                    "average_similarity": float(means[i]),
+                    "matching_chunks": int(counts[i]),
+                    "sample_chunks": doc_chunks[:2]  # Include a few sample chunks
                 })
-            
-            # Sort by similarity and return top results
-            similar_docs.sort(key=lambda x: x["average_similarity"], reverse=True)
-            return similar_docs[:top_k]
-            
+            return similar_docs
+
         except Exception as e:
             print(f"Error finding similar documents: {e}")
             return []
@@ -239,19 +681,24 @@ class VectorStore:
             
             if not results["ids"]:
                 return False
-            
-            # Update metadata
-            updated_metadatas = []
+
+            # Update each fetched dict in place; no per-chunk dict copies
             for metadata in results["metadatas"]:
-                updated_metadata = {**metadata, **metadata_updates}
-                updated_metadatas.append(updated_metadata)
-            
+                metadata.update(metadata_updates)
+
             # Update in ChromaDB
             self.collection.update(
                 ids=results["ids"],
-                metadatas=updated_metadatas
+                metadatas=results["metadatas"]
             )
-            
+
+            # Keep the in-memory index in step
+            with self._index_lock:
+                for metadata in self._index_metas:
+                    if metadata.get("document_id") == document_id:
+                        metadata.update(metadata_updates)
+            self._save_index_sidecar()
+
             return True
             
         except Exception as e: